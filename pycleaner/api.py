@@ -8,6 +8,19 @@ import os
 from . import lib_script_split, utils
 
 
+def _positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+
+    if number <= 0:
+        raise argparse.ArgumentTypeError(
+            f"expected a positive integer, got '{value}'"
+        )
+    return number
+
+
 def _parsed_args():
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -32,6 +45,13 @@ def _parsed_args():
         default=False,
         help="Search all imports, even indented",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=_positive_int,
+        default=None,
+        help="Number of threads parsing files. Default: the number of CPUs",
+    )
     parser.add_argument(
         "--abs-path",
         action="store_true",
@@ -112,12 +132,12 @@ def api_call():
             "It is not supposed --rm-scripts and --zip-lib"
             " options are used simultaneously"
         )
-    parser = utils.python_parser()
     sorter = lib_script_split.PyProjectDeps(
-        parser,
+        utils.python_parser,
         project_dir=args.project,
         target_files=args.target.split(","),
         deep_walk=args.deep,
+        workers=args.jobs,
     )
     cli = cmd.Cmd()
     try:
@@ -10,23 +10,27 @@ in the project directory.
 TODO: Take into account the possibility of site-package paths being modified.
       It may be partially addressed in some way.
 """
+import functools
 import importlib.util
 import logging
+import os
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from importlib.machinery import ModuleSpec
-from tree_sitter import Node
+from tree_sitter import Node, Parser
 from pathlib import Path
 
 from . import utils
 
 
+@functools.cache
 def dot_parent_stem_split(name: str) -> (str, str):
     """
     Return parent and name of a file given as the string `name`.
+    The results are cached since the same dotted names recur in imports.
     """
     dot_id = name.rfind(".")
-    prefix, name = name[:dot_id], name[dot_id + 1 :]
-    return prefix, name
+    return name[:dot_id], name[dot_id + 1 :]
 
 
 def dotted_name_spec(dotted_name: str, silent=False) -> ModuleSpec | None:
@@ -54,11 +58,16 @@ class PyProjectDeps:
     or indirect dependencies among Python files in the project directory.
 
     Params:
-      parser - Python tree-sitter parser
+      parser - Python tree-sitter parser or callable returning one to use
+               in the calling thread (e.g., `utils.python_parser`). Since
+               a parser must not be shared between threads, passing
+               a parser instance makes `workers` fall back to 1.
       target_files - core project py-files
       project_dir - Python project directory
       deep_walk - whether to search all import statements, even indented ones.
                   Default: False. Deep exploration will require much more time.
+      workers - number of threads parsing files concurrently.
+                Default: None, that is, the number of CPUs.
     """
 
     def __init__(
@@ -67,9 +76,18 @@ class PyProjectDeps:
         target_files: str,
         project_dir: str,
         deep_walk: bool = False,
+        workers: int = None,
     ):
-        self.parser = parser
+        if isinstance(parser, Parser):
+            self.parser_factory = lambda: parser
+            workers = 1
+        else:
+            self.parser_factory = parser
+
         self.deep_walk = deep_walk
+        self.workers = os.cpu_count() if workers is None else workers
+        assert self.workers > 0, f"Expected workers > 0, got {self.workers}"
+        self._imports_query = utils.imports_query() if deep_walk else None
         self.target_files = target_files
         self.cwd = Path(project_dir).resolve()
         assert (
@@ -80,13 +98,30 @@ class PyProjectDeps:
         self.may_found = defaultdict(set)
 
         self.core_files = [str(x) for x in self.add_targets(target_files)]
-        self.wd_files = {str(x) for x in self.cwd.rglob("*.py")}
+        self.wd_files = set(utils.walk_py(self.cwd))
+        self._suffix_index = self._build_suffix_index()
+        ## Specs are cached per instance, since they depend on `sys.path`
+        ## and the current directory, which may change between scans.
+        self._spec_cache = {}
 
-        self._simple_imports = []
-        self._from_imports = []
-        self._currently_inspected = None
         self._scripts = {}
 
+    def _build_suffix_index(self) -> dict[str, list[str]]:
+        """
+        Map every path suffix (relative to `self.cwd`) of the project
+        py-files to the files having it, e.g., "b/c.py" -> ["/proj/a/b/c.py"].
+        This way, `similar_to_dotted_name` finds files by suffix with
+        a dict lookup instead of scanning the project.
+        """
+        index = defaultdict(list)
+        start = len(f"{str(self.cwd).rstrip('/')}/")
+        for path in self.wd_files:
+            parts = path[start:].split("/")
+            for i in range(len(parts)):
+                index["/".join(parts[i:])].append(path)
+
+        return dict(index)
+
     def recursive_call(self) -> (list[str], list[str]):
         """
         Check imports of the core files (target_files).
@@ -95,35 +130,43 @@ class PyProjectDeps:
         """
         libs = []
         self._scripts = self.wd_files.copy()
-        for x in self.core_files:
-            self._scripts.remove(x)
-
-        ## Though `seen` set is not strictly necessary, it helps
-        ## to get rid of redundant `module_paths` calls.
-        seen = set()
-        while len(self._lifo_queue) > 0:
-            filename = self._lifo_queue.pop()
-            if filename in seen:
-                continue
-
-            seen.add(filename)
-            for path in self.module_paths(filename):
-                if path in self._scripts:
-                    self._lifo_queue.append(path)
-                    self._scripts.remove(path)
-                    libs.append(path)
-
+        ## Core files may reside in the directories skipped by `walk_py`.
+        self._scripts.difference_update(self.core_files)
+
+        ## Files are explored frontier by frontier. The files of a frontier
+        ## are read and parsed concurrently, whereas import resolution and
+        ## bookkeeping (`not_found`, `may_found`) stay in this thread.
+        ## A file gets to the next frontier only once, since it is removed
+        ## from `self._scripts` at the same time.
+        frontier = self.core_files
+        with ThreadPoolExecutor(self.workers) as pool:
+            while len(frontier) > 0:
+                next_frontier = []
+                parsed = pool.map(self.file_imports_of, frontier)
+                for filename, imports in zip(frontier, parsed):
+                    for path in self._resolve_imports(filename, *imports):
+                        if path in self._scripts:
+                            next_frontier.append(path)
+                            self._scripts.remove(path)
+                            libs.append(path)
+
+                frontier = next_frontier
+
+        ## A script is dropped if the path segments of a not found module
+        ## occur in its path, e.g., "a.b" in "/proj/x/a/b.py" or in
+        ## "/proj/a/b/c.py". Slashes around the needles and paths make
+        ## the substring search match whole segments only.
+        if len(self.not_found) == 0:
+            return libs, list(self._scripts)
+
+        needles = {
+            f"/{miss.lstrip('.').replace('.', '/')}/"
+            for miss in self.not_found
+        }
         scripts = []
         for path in self._scripts:
-            add_flag = True
-            for miss in self.not_found:
-                miss = miss.lstrip(".").split(".")
-                path_set = path.removesuffix(".py").split("/")
-                if utils.is_sublist(miss, path_set):
-                    add_flag = False
-                    break
-
-            if add_flag:
+            path_slashed = f"/{path.removesuffix('.py')}/"
+            if not any(needle in path_slashed for needle in needles):
                 scripts.append(path)
 
         return libs, scripts
@@ -147,25 +190,25 @@ class PyProjectDeps:
                 scripts.append(name)
         return libs, scripts
 
-    def add_targets(self, paths: str | list[str]) -> list[Path]:
+    def add_targets(self, paths: str | list[str]) -> list[str | Path]:
         """
-        Add the core project files to a LIFO queue - `self._lifo_queue`.
+        Collect the core project files from the target files and folders.
         """
         paths = paths if isinstance(paths, list) else [paths]
         assert not utils.contains_prefix(paths), (
             "Some of the specified target folders contain other"
             " target folders or files, or targets are specified repeatedly."
         )
-        self._lifo_queue = []
+        targets = []
         for path in paths:
-            self._lifo_queue.extend(self._add_targets(path))
+            targets.extend(self._add_targets(path))
 
-        return self._lifo_queue.copy()
+        return targets
 
-    def _add_targets(self, path: str) -> list[Path]:
+    def _add_targets(self, path: str) -> list[str | Path]:
         p = self.cwd / path
         assert p.exists(), f"Not found --target='{path}'"
-        targets = list(p.rglob("*.py")) if p.is_dir() else [p]
+        targets = list(utils.walk_py(p)) if p.is_dir() else [p]
         return targets
 
     def module_paths(self, filename: str | Path) -> list[str]:
@@ -177,52 +220,96 @@ class PyProjectDeps:
 
         Takes Path, can work with str.
         """
-        self._currently_inspected = str(filename)
-        import_lines = self._raw_import_lines(filename)
-        self.file_imports(import_lines)
+        return self._resolve_imports(filename, *self.file_imports_of(filename))
 
+    def file_imports_of(
+        self, filename: str | Path
+    ) -> (list[list[str]], list[list[str]]):
+        """
+        Parse the file and return its `simple_imports` and `from_imports`
+        (see `file_imports`). Safe to call from multiple threads.
+
+        Takes Path, can work with str.
+        """
+        return self.file_imports(self._raw_import_lines(filename))
+
+    def _resolve_imports(
+        self,
+        filename: str | Path,
+        simple_imports: list[list[str]],
+        from_imports: list[list[str]],
+    ) -> list[str]:
+        inspected = str(filename)
         paths = []
-        for modules in self._simple_imports:
-            self._parse_raw_modules(modules, paths)
+        for modules in simple_imports:
+            self._parse_simple(modules, paths, inspected)
 
-        for modules in self._from_imports:
-            self._parse_raw_modules(modules[1:], paths, modules[0])
+        for modules in from_imports:
+            self._parse_from(modules[0], modules[1:], paths, inspected)
 
-        self._currently_inspected = None
         return paths
 
     def _raw_import_lines(self, filename: str | Path) -> list[Node]:
         """
+        Return import statement nodes of the file: only top-level ones
+        or, if `self.deep_walk` is True, all of them. In the latter case,
+        the tree is traversed by tree-sitter's query engine.
+
         Takes Path, can work with str.
         """
-        with open(filename, "rb") as fd:
-            tree = self.parser.parse(fd.read())
-            return tree.root_node.children
+        ## Unbuffered read of the whole file at once: the file object's
+        ## buffering only adds an extra copy for a single full read.
+        fd = os.open(filename, os.O_RDONLY)
+        try:
+            source = os.read(fd, os.fstat(fd).st_size)
+        finally:
+            os.close(fd)
+
+        tree = self.parser_factory().parse(source)
+
+        if self.deep_walk:
+            captures = self._imports_query.captures(tree.root_node)
+            return [node for node, _ in captures]
+
+        return [
+            node
+            for node in tree.root_node.children
+            if node.type in ("import_statement", "import_from_statement")
+        ]
 
-    def _parse_raw_modules(
-        self, modules: list[str], paths: list[str], prefix: str = None
+    def _parse_simple(
+        self, modules: list[str], paths: list[str], inspected: str
     ):
         for m in modules:
-            dn = m if prefix is None else f"{prefix}.{m}"
-            name = self._module_path(m, prefix)
-            if name in (dn, prefix):
-                self.not_found[name].add(self._currently_inspected)
+            prefix = m[: m.rfind(".")]
+            name = self._module_path(m, prefix, inspected)
+            if name == m:
+                self.not_found[name].add(inspected)
                 continue
 
             paths.append(name)
 
-    def _module_path(self, name: str, prefix: str = None) -> str:
-        if prefix is None:
-            dotted_name = name
-            prefix, name = dot_parent_stem_split(name)
-        else:
-            dotted_name = f"{prefix}.{name}"
+    def _parse_from(
+        self, prefix: str, modules: list[str], paths: list[str], inspected: str
+    ):
+        prefix_dot = prefix + "."
+        for m in modules:
+            dn = prefix_dot + m
+            name = self._module_path(dn, prefix, inspected)
+            if name in (dn, prefix):
+                self.not_found[name].add(inspected)
+                continue
+
+            paths.append(name)
 
-        spec = dotted_name_spec(dotted_name)
+    def _module_path(
+        self, dotted_name: str, prefix: str, inspected: str
+    ) -> str:
+        spec = self._dotted_name_spec(dotted_name)
         if spec is None:
-            spec = dotted_name_spec(prefix)
+            spec = self._dotted_name_spec(prefix)
         if spec is None:
-            return self.similar_to_dotted_name(dotted_name)
+            return self.similar_to_dotted_name(dotted_name, inspected)
 
         if spec.origin is None:
             return dotted_name
@@ -231,85 +318,98 @@ class PyProjectDeps:
 
         return f"{spec.origin}/__init__.py"
 
-    def similar_to_dotted_name(self, dotted_name: str) -> str:
+    def _dotted_name_spec(self, dotted_name: str) -> ModuleSpec | None:
+        """
+        Memoized `dotted_name_spec`. The same dotted names are looked up
+        over and over again while walking the project, and each lookup
+        stats every entry of `sys.path`.
+        """
+        if dotted_name not in self._spec_cache:
+            self._spec_cache[dotted_name] = dotted_name_spec(dotted_name)
+        return self._spec_cache[dotted_name]
+
+    def similar_to_dotted_name(
+        self, dotted_name: str, inspected: str = None
+    ) -> str:
         """
         Try to find similar module, package to `dotted_name` or parent thereof.
         The `dotted_name` is first transformed to path suffix by trimming the
         leading dot if need be and replacing dots with right slash.
+        `inspected` is the file importing `dotted_name`; together they key
+        the ambiguous matches in `self.may_found`.
         """
         name = dotted_name.lstrip(".").replace(".", "/")
-        similar = set(self.cwd.rglob(f"{name}.py"))
+        similar = set(self._suffix_index.get(f"{name}.py", ()))
         may_found = similar.copy()
         fallback = dotted_name
 
         if len(similar) == 0:
-            pat = f"{name}/__init__.py"
-            similar = set(self.cwd.rglob(pat))
+            similar = set(self._suffix_index.get(f"{name}/__init__.py", ()))
             may_found |= similar
 
         if len(similar) == 0:
-            name = str(Path(name).parent)
-            similar = set(self.cwd.rglob(f"{name}.py"))
+            name = name.rpartition("/")[0] or "."
+            similar = set(self._suffix_index.get(f"{name}.py", ()))
             dotted_name, _ = dot_parent_stem_split(dotted_name)
             may_found |= similar
 
         if len(similar) == 0:
-            pat = f"{name}/__init__.py"
-            similar = set(self.cwd.rglob(pat))
+            similar = set(self._suffix_index.get(f"{name}/__init__.py", ()))
             may_found |= similar
 
         if len(similar) == 0:
             dotted_name = fallback
 
         if len(similar) == 1:
-            return str(next(iter(similar)))
+            return next(iter(similar))
 
         if len(may_found) > 0:
-            key = (dotted_name, self._currently_inspected)
-            self.may_found[key].update(map(str, may_found))
+            key = (dotted_name, inspected)
+            self.may_found[key] |= may_found
 
         return dotted_name
 
-    def file_imports(self, import_lines: list[Node]):
+    def file_imports(
+        self, import_lines: list[Node]
+    ) -> (list[list[str]], list[list[str]]):
         """
         Process parsed import statements `import lines`, split it into
         imports starting from keywords `import` (`simple_imports`) and
         `from` (`from_imports`).
         """
+        simple_imports, from_imports = [], []
         for node in import_lines:
-            self._node_walk_collect(node)
+            self._extract_imports(node, simple_imports, from_imports)
 
-    def _node_walk_collect(self, node: Node):
-        if node.type in ["import_statement", "import_from_statement"]:
-            self._extract_imports(node)
-
-        if self.deep_walk:
-            for child in node.children:
-                self._node_walk_collect(child)
+        return simple_imports, from_imports
 
-    def _extract_imports(self, node: Node):
+    def _extract_imports(
+        self,
+        node: Node,
+        simple_imports: list[list[str]],
+        from_imports: list[list[str]],
+    ):
         import_type = node.children[0].type
         content = []
 
         if import_type == "from":
             content.append(node.children[1].text.decode("ascii"))
             content.extend(self._unalias(node.children[3:]))
-            self._from_imports.append(content)
+            from_imports.append(content)
         elif import_type == "import":
             content.extend(self._unalias(node.children[1:]))
-            self._simple_imports.append(content)
+            simple_imports.append(content)
         else:
             raise ValueError("Unknown import type")
 
     def _unalias(self, imports: list[Node]) -> list[str]:
         texts = []
         for node in imports:
-            text = node.text.decode("ascii")
             if node.type == "aliased_import":
-                texts.append(text.replace(" as ", " ").split()[0])
-            elif node.type == "dotted_name":
-                texts.append(text)
-            else:
+                node = node.child_by_field_name("name")
+            elif node.type != "dotted_name":
                 continue
 
+            texts.append(node.text.decode("ascii"))
+
         return texts
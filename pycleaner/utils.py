@@ -1,29 +1,107 @@
 """
 Utility functions.
 """
+import functools
+import os
+import threading
 import zipfile
 from pathlib import Path
-from typing import Any
+from typing import Iterator
 
-from tree_sitter import Language, Parser
+from tree_sitter import Language, Parser, Query
 
 
-def python_parser() -> Parser:
+IMPORTS_QUERY = "[(import_statement) (import_from_statement)] @import"
+
+
+_PY_LANG_LOCK = threading.Lock()
+_THREAD_LOCAL = threading.local()
+
+
+def python_language() -> Language:
     """
-    Build Python parser for the user with tree-sitter.
+    Load tree-sitter's Python grammar. The loaded language is kept
+    for subsequent calls.
     """
-    parser = Parser()
+    ## The lock keeps concurrent first calls from compiling the grammar twice.
+    with _PY_LANG_LOCK:
+        return _load_python_language()
+
+
+@functools.cache
+def _load_python_language() -> Language:
     cwd = Path(__file__).parent.resolve()
     # lang_so = cwd / "tree-sitter-python/build/lang.so"
     # Language.build_library(lang_so, [cwd / "tree-sitter-python"])
     ## For compatibility with old versions, use f-strings instead.
     lang_so = f"{cwd}/tree-sitter-python/build/lang.so"
     Language.build_library(lang_so, [f"{cwd}/tree-sitter-python"])
-    py_lang = Language(lang_so, "python")
-    parser.set_language(py_lang)
+    return Language(lang_so, "python")
+
+
+def python_parser() -> Parser:
+    """
+    Build Python parser for the user with tree-sitter.
+    A parser must not be shared between threads, so one is created
+    per thread and reused by subsequent calls from that thread.
+    """
+    parser = getattr(_THREAD_LOCAL, "parser", None)
+    if parser is None:
+        parser = _THREAD_LOCAL.parser = Parser()
+        parser.set_language(python_language())
     return parser
 
 
+@functools.cache
+def imports_query() -> Query:
+    """
+    Compile tree-sitter query that matches import statements at any depth.
+    The query is compiled once and shared.
+    """
+    return python_language().query(IMPORTS_QUERY)
+
+
+## VCS, virtual environment and cache dirs only. Names like "build" or
+## "dist" are not skipped, since real packages are often called so.
+SKIP_DIRS = frozenset(
+    {
+        ".git",
+        ".venv",
+        "venv",
+        "__pycache__",
+        "node_modules",
+        ".tox",
+        ".mypy_cache",
+    }
+)
+
+
+def walk_py(
+    root: str | Path, skip: frozenset[str] = SKIP_DIRS
+) -> Iterator[str]:
+    """
+    Yield paths to py-files found under `root` recursively.
+    Directories whose names are in `skip` are not descended into.
+
+    Unlike `Path.rglob`, it yields plain strings and reuses the file type
+    info returned by `os.scandir` instead of stat'ing every entry again.
+    """
+    stack = [str(root)]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in skip:
+                        stack.append(entry.path)
+                elif entry.name.endswith(".py") and entry.is_file():
+                    yield entry.path
+
+
 def rel_paths(paths: str | list[str], rel: str | Path = None) -> list[str]:
     """
     Return paths that are relative to `rel`.
@@ -36,7 +114,15 @@ def rel_paths(paths: str | list[str], rel: str | Path = None) -> list[str]:
     if isinstance(paths, str):
         paths = [paths]
 
-    paths = [str(Path(f).relative_to(rel)) for f in paths]
+    ## The paths normally start with `rel` (they are collected under it),
+    ## so stripping the prefix suffices; `Path.relative_to` is a fallback.
+    prefix = f"{str(rel).rstrip('/')}/"
+    paths = [
+        f.removeprefix(prefix)
+        if f.startswith(prefix)
+        else str(Path(f).relative_to(rel))
+        for f in paths
+    ]
     return paths
 
 
@@ -104,62 +190,14 @@ def may_found_dict_to_list(
     return new_files
 
 
-def largest_common_prefix(strings: list[str]) -> str:
-    """
-    Find the largest common prefix in the `strings` list.
-    """
-    path_iter = iter(strings)
-    res = next(path_iter)
-
-    for path in path_iter:
-        while not path.startswith(res):
-            res = res[:-1]
-            if len(res) == 0:
-                return ""
-
-    return res
-
-
 def contains_prefix(strings: list[str]) -> bool:
     """
     Check if there is a string in the list that is the prefix
     of another string from the list.
-    """
-    lcp = largest_common_prefix(strings)
-    strings = iter(sorted([x.removeprefix(lcp) for x in strings]))
-    prev_val = next(strings)
 
-    for val in strings:
-        if val.startswith(prev_val):
-            return True
-
-        prev_val = val
-
-    return False
-
-
-def is_sublist(small: list[Any], big: list[Any]) -> bool:
-    """
-    Check whether `big` contains `small`
+    If a string is the prefix of others, it is also the prefix of the
+    string following it in the sorted list, so checking adjacent pairs
+    of the sorted list is enough.
     """
-    if len(small) > len(big):
-        return False
-
-    if len(small) == 0:
-        return True
-
-    start = 0
-    for start, big_el in enumerate(big):
-        if start > len(big) - len(small):
-            return False
-
-        if big_el == small[0]:
-            break
-    else:
-        return False
-
-    for i in range(1, len(small)):
-        if small[i] != big[i + start]:
-            return False
-
-    return True
+    strings = sorted(strings)
+    return any(b.startswith(a) for a, b in zip(strings, strings[1:]))